@@ -6,29 +6,41 @@ AkShare MCP 服务器
 
 import os
 import json
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from dataclasses import dataclass
 from typing import Optional, Annotated
 from datetime import datetime
 
-import akshare as ak
-import pandas as pd
 from fastmcp import FastMCP
 from pydantic import Field
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
 
 # 导入工具函数
-from tools.stock_us_hist import stock_us_hist
-from tools.stock_hk_hist import stock_hk_hist
-from tools.stock_zh_a_hist import stock_zh_a_hist
+from tools.stock_us_hist import stock_us_hist, stock_us_hist_batch
+from tools.stock_hk_hist import stock_hk_hist, stock_hk_hist_batch
+from tools.stock_zh_a_hist import stock_zh_a_hist, stock_zh_a_hist_batch
 
-# 配置日志
+# 配置日志：请求线程只把日志记录放入队列，由后台线程负责写文件和控制台
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('logs/akshare_mcp.log'),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+# 入队前只合并消息参数，完整格式由监听线程中的处理器负责
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/akshare_mcp.log'),
-        logging.StreamHandler()
-    ]
+    format='%(message)s',
+    handlers=[QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -38,6 +50,8 @@ class ServerConfig:
     host: str = os.getenv("HOST", "127.0.0.1")
     port: int = int(os.getenv("PORT", "8005"))
     transport: str = os.getenv("TRANSPORT", "sse")
+    json_response: bool = os.getenv("JSON_RESPONSE", "").lower() in ("1", "true", "yes")
+    gzip_minimum_size: int = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
     server_name: str = "AkShare-MCP-Server"
 
 # 创建MCP实例
@@ -45,8 +59,11 @@ mcp = FastMCP("AkShare数据服务")
 
 # 注册工具
 mcp.tool()(stock_us_hist)
+mcp.tool()(stock_us_hist_batch)
 mcp.tool()(stock_hk_hist)
+mcp.tool()(stock_hk_hist_batch)
 mcp.tool()(stock_zh_a_hist)
+mcp.tool()(stock_zh_a_hist_batch)
 
 def main():
     """启动MCP服务器"""
@@ -55,19 +72,32 @@ def main():
     # 确保日志目录存在
     os.makedirs("logs", exist_ok=True)
     
-    logger.info(f"启动 {config.server_name}")
-    logger.info(f"传输协议: {config.transport}")
-    logger.info(f"服务地址: {config.host}:{config.port}")
+    logger.info("启动 %s", config.server_name)
+    logger.info("传输协议: %s", config.transport)
+    logger.info("服务地址: %s:%s", config.host, config.port)
+    
+    # HTTP 传输可选择以 JSON 响应返回工具结果（JSON_RESPONSE，默认关闭）。
+    # 该模式下 MCP 会丢弃请求过程中的通知，进度通知无法送达客户端。
+    # Starlette 不压缩 text/event-stream，只有 JSON 响应才能被 gzip 压缩，
+    # 因此仅在开启 JSON 响应时安装压缩中间件；GZIP_MINIMUM_SIZE 设为 0 时关闭
+    run_kwargs = {}
+    if config.transport in ("http", "streamable-http") and config.json_response:
+        run_kwargs["json_response"] = True
+        if config.gzip_minimum_size > 0:
+            run_kwargs["middleware"] = [
+                Middleware(GZipMiddleware, minimum_size=config.gzip_minimum_size, compresslevel=6)
+            ]
     
     try:
         # 启动SSE服务器
         mcp.run(
             transport=config.transport,
             host=config.host,
-            port=config.port
+            port=config.port,
+            **run_kwargs
         )
     except Exception as e:
-        logger.error(f"服务器启动失败: {e}")
+        logger.error("服务器启动失败: %s", e)
         raise
 
 if __name__ == "__main__":
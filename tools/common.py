@@ -0,0 +1,529 @@
+"""
+工具公共组件
+"""
+
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Literal
+
+import orjson
+import requests
+from cachetools import TLRUCache
+from pydantic import BaseModel, ValidationError, field_validator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# akshare、pandas、numpy 导入耗时一秒以上，推迟到首次使用时加载，服务启动后即可接受连接
+ak = None
+np = None
+pd = None
+_LIBS_LOCK = threading.Lock()
+
+
+def _ensure_libs():
+    """首次调用时导入 akshare 及其依赖的 numpy、pandas"""
+    global ak, np, pd
+    if ak is not None:
+        return
+    with _LIBS_LOCK:
+        if ak is None:
+            import numpy as _np
+            import pandas as _pd
+            import akshare as _ak
+            np = _np
+            pd = _pd
+            ak = _ak
+
+
+# AkShare 接口均为阻塞式 HTTP 请求，统一放入线程池执行，避免阻塞事件循环
+EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="akshare")
+
+
+class _SessionRequests:
+    """替换 AkShare 模块中的 requests 引用：get 走共享 Session，其余属性仍取自 requests"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def get(self, url, **kwargs):
+        return self._session.get(url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def _create_session():
+    """创建带连接池与重试的共享 Session，复用到东方财富的 TCP/TLS 连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.3, allowed_methods=frozenset({'GET'}))
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_SESSION_REQUESTS = _SessionRequests(_create_session())
+_PATCHED_MODULES = set()
+_UNPATCHED_WARNED = set()
+_PATCH_LOCK = threading.Lock()
+
+
+def _use_shared_session(ak_fn):
+    """
+    让 ak_fn 所在模块改用共享 Session 发请求
+
+    AkShare 行情接口直接调用模块级的 requests.get，每次都新建连接且没有对外的
+    Session 配置入口，因此只替换该模块的 requests 引用，不影响其他库。
+    """
+    name = ak_fn.__module__
+    if name in _PATCHED_MODULES:
+        return
+    with _PATCH_LOCK:
+        if name in _PATCHED_MODULES:
+            return
+        module = sys.modules.get(name)
+        current = getattr(module, 'requests', None)
+        if current is _SESSION_REQUESTS:
+            _PATCHED_MODULES.add(name)
+        elif current is requests:
+            module.requests = _SESSION_REQUESTS
+            _PATCHED_MODULES.add(name)
+        elif name not in _UNPATCHED_WARNED:
+            # 不计入已处理集合，之后每次请求仍会重试替换，但只告警一次
+            _UNPATCHED_WARNED.add(name)
+            logger.warning("%s 未直接使用 requests 模块，%s 无法使用共享连接池", name, ak_fn.__name__)
+
+
+# 行情缓存：历史区间数据不会变化，缓存 5 分钟；包含当天的区间仍在更新，仅缓存 1 分钟
+_HIST_TTL = 300
+_LIVE_TTL = 60
+# 缓存值为 (DataFrame, 剩余有效秒数)，从磁盘缓存载入的数据只保留其剩余有效期
+_HIST_CACHE = TLRUCache(maxsize=512, ttu=lambda key, value, now: now + value[1])
+_LIVE_CACHE = TLRUCache(maxsize=128, ttu=lambda key, value, now: now + value[1])
+_CACHE_LOCK = threading.Lock()
+
+# 二级磁盘缓存：Parquet 文件可在多个服务进程间共享，有效期与内存缓存相同；设为空字符串时关闭
+CACHE_DIR = os.getenv("AKSHARE_CACHE_DIR", ".cache")
+# 清理过期磁盘缓存的最短间隔（秒）
+_PRUNE_INTERVAL = 60
+_last_prune = 0.0
+_PRUNE_LOCK = threading.Lock()
+
+# 批量工具单次最多查询的代码数量
+MAX_BATCH_SYMBOLS = 20
+
+_ADJUST_LABEL = {'': '不复权', 'qfq': '前复权', 'hfq': '后复权'}
+
+_TEMPLATE = (
+    "# {market}历史行情数据\n"
+    "\n**股票代码**: {symbol}  "
+    "\n**数据周期**: {period}  "
+    "\n**日期范围**: {start_date} ~ {end_date}  "
+    "\n**复权方式**: {adjust_label}  "
+    "\n**数据条数**: {rows} 条  "
+    "\n**货币单位**: {currency}{extra_header}\n"
+    "\n{md_table}\n"
+    "\n*数据来源：东方财富网*{extra_footer}\n"
+)
+
+# 输出保留的列，可用逗号分隔的 AKSHARE_KEEP_COLUMNS 覆盖；设为空字符串时保留全部列
+KEEP_COLUMNS = [c.strip() for c in os.getenv("AKSHARE_KEEP_COLUMNS", "日期,开盘,收盘,最高,最低,成交量,成交额").split(",") if c.strip()]
+
+# 超过该行数的结果改用 CSV 输出，避免长区间的 Markdown 表格占用过多传输与上下文
+MARKDOWN_MAX_ROWS = 200
+
+
+async def run_blocking(func, /, *args, **kwargs):
+    """在线程池中执行阻塞函数，并等待其结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+def _err(msg, code):
+    """构造 JSON 格式的错误返回"""
+    return orjson.dumps({"error": msg, "code": code}).decode('utf-8')
+
+
+def _valid_yyyymmdd(s):
+    """快速校验 YYYYMMDD 格式日期（只检查各字段范围，不做完整日历校验）"""
+    return (
+        len(s) == 8 and s.isascii() and s.isdigit()
+        and 1900 <= int(s[:4]) <= 2300
+        and 1 <= int(s[4:6]) <= 12
+        and 1 <= int(s[6:8]) <= 31
+    )
+
+
+def _disk_cache_path(key):
+    """磁盘缓存文件路径；代码等参数来自用户输入，文件名使用其摘要以免路径注入"""
+    # 保留列配置不同的进程写出的文件列不同，因此一并计入摘要
+    digest = hashlib.sha1(repr((key, KEEP_COLUMNS)).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key[0]}_{digest}.parquet")
+
+
+def _read_disk_cache(key, ttl):
+    """
+    读取未过期的磁盘缓存，返回 (DataFrame, 剩余有效秒数)
+
+    不存在、已过期或读取失败时返回 (None, 0)。
+    """
+    path = _disk_cache_path(key)
+    try:
+        remaining = ttl - (time.time() - os.path.getmtime(path))
+        if remaining <= 0:
+            return None, 0
+        return pd.read_parquet(path), remaining
+    except FileNotFoundError:
+        return None, 0
+    except Exception as e:
+        logger.warning("读取磁盘缓存失败: %s, %s", path, e)
+        return None, 0
+
+
+def _prune_disk_cache():
+    """
+    删除超过最长有效期的缓存文件及残留临时文件，间隔 _PRUNE_INTERVAL 秒以上才执行一次
+
+    开放区间的缓存键包含当天日期，每天都会产生新文件，因此需要定期清理。
+    """
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < _PRUNE_INTERVAL or not _PRUNE_LOCK.acquire(blocking=False):
+        return
+    try:
+        _last_prune = now
+        with os.scandir(CACHE_DIR) as entries:
+            for entry in entries:
+                if not entry.name.endswith(('.parquet', '.tmp')):
+                    continue
+                try:
+                    if now - entry.stat().st_mtime >= _HIST_TTL:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("清理磁盘缓存失败: %s, %s", CACHE_DIR, e)
+    finally:
+        _PRUNE_LOCK.release()
+
+
+def _write_disk_cache(key, df):
+    """写入磁盘缓存；先写临时文件再原子替换，避免其他进程读到半个文件"""
+    path = _disk_cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning("写入磁盘缓存失败: %s, %s", path, e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    _prune_disk_cache()
+
+
+class HistQuery(BaseModel):
+    """历史行情查询参数，校验器在类定义时编译一次"""
+    symbol: str
+    period: Literal['daily', 'weekly', 'monthly'] = 'daily'
+    start_date: str
+    end_date: str
+    adjust: Literal['', 'qfq', 'hfq'] = ''
+
+    @field_validator('start_date', 'end_date')
+    @classmethod
+    def _check_date(cls, value):
+        if not _valid_yyyymmdd(value):
+            raise ValueError("日期格式错误，请使用 YYYYMMDD 格式")
+        return value
+
+
+# 各字段校验失败时返回的错误信息与错误码
+_FIELD_ERRORS = {
+    'period': ("period参数必须是 'daily', 'weekly', 'monthly' 之一", "INVALID_PERIOD"),
+    'start_date': ("日期格式错误，请使用 YYYYMMDD 格式", "INVALID_DATE_FORMAT"),
+    'end_date': ("日期格式错误，请使用 YYYYMMDD 格式", "INVALID_DATE_FORMAT"),
+    'adjust': ("adjust参数必须是 '', 'qfq', 'hfq' 之一", "INVALID_ADJUST"),
+}
+
+
+def _project(df):
+    """只保留 KEEP_COLUMNS 中的列（按其顺序），减少缓存占用和渲染工作量"""
+    if not KEEP_COLUMNS:
+        return df
+    return df[[c for c in KEEP_COLUMNS if c in df.columns]]
+
+
+def fetch_hist(fn_name, symbol, period, start_date, end_date, adjust, **kwargs):
+    """
+    调用 AkShare 历史行情接口 ak.<fn_name>，结果按 (接口, 代码, 周期, 起止日期, 复权) 缓存
+
+    依次查找内存缓存、磁盘缓存（CACHE_DIR 非空时），均未命中才发起网络请求。
+
+    结束日期晚于今天时按今天处理，使 '22220101' 这类开放区间共用同一缓存项。
+    返回的 DataFrame 即缓存对象本身，调用方不得原地修改（可用 assign 生成新表）。
+    """
+    _ensure_libs()
+    today = datetime.now().strftime("%Y%m%d")
+    if end_date >= today:
+        end_date = today
+        cache, ttl = _LIVE_CACHE, _LIVE_TTL
+    else:
+        cache, ttl = _HIST_CACHE, _HIST_TTL
+    key = (fn_name, symbol, period, start_date, end_date, adjust)
+
+    with _CACHE_LOCK:
+        entry = cache.get(key)
+    if entry is not None:
+        return entry[0]
+
+    df = None
+    if CACHE_DIR:
+        df, remaining = _read_disk_cache(key, ttl)
+    if df is None:
+        remaining = ttl
+        ak_fn = getattr(ak, fn_name)
+        _use_shared_session(ak_fn)
+        df = _project(ak_fn(
+            symbol=symbol,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=adjust,
+            **kwargs
+        ))
+        # 空结果可能只是数据源的临时异常，不缓存，下次调用重新请求
+        if df.empty:
+            return df
+        if CACHE_DIR:
+            _write_disk_cache(key, df)
+    with _CACHE_LOCK:
+        cache[key] = (df, remaining)
+    return df
+
+
+def format_dates(col):
+    """
+    将日期列转换为 YYYY-MM-DD 字符串
+
+    直接把 datetime64 转为天精度后由 NumPy 生成 ISO 字符串，避免 .dt.strftime
+    逐元素调用 Python 格式化；非 datetime64 列（如 datetime.date 对象）先解析。
+    """
+    values = col.to_numpy()
+    if not np.issubdtype(values.dtype, np.datetime64):
+        values = pd.to_datetime(col).to_numpy()
+    return values.astype("datetime64[D]").astype(str)
+
+
+def _display_width(text):
+    """字符串在等宽字体下的显示宽度（中文等全角字符占两格）"""
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+
+
+def df_to_md(df):
+    """
+    将 DataFrame 渲染为 Markdown 管道表格
+
+    数值列右对齐、浮点数保留两位小数，其余列左对齐。各列的格式化与补齐
+    均以整列为单位在 NumPy 中完成，不逐个单元格调用 Python 格式化。
+    """
+    headers = []
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_float_dtype(col):
+            cells = np.char.mod("%.2f", col.to_numpy(dtype=float, na_value=np.nan))
+            numeric = True
+        else:
+            cells = col.astype(str).to_numpy().astype(str)
+            numeric = pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col)
+        header = str(name)
+        header_width = _display_width(header)
+        width = max(header_width, int(np.char.str_len(cells).max()) if len(cells) else 0)
+        padding = " " * (width - header_width)
+        if numeric:
+            headers.append((padding + header, "-" * (width + 1) + ":"))
+            columns.append(np.char.rjust(cells, width))
+        else:
+            headers.append((header + padding, ":" + "-" * (width + 1)))
+            columns.append(np.char.ljust(cells, width))
+
+    lines = [
+        "| " + " | ".join(h for h, _ in headers) + " |",
+        "|" + "|".join(sep for _, sep in headers) + "|",
+    ]
+    lines.extend("| " + " | ".join(row) + " |" for row in zip(*columns))
+    return "\n".join(lines)
+
+
+def render_table(df):
+    """小结果渲染为 Markdown 表格，大结果渲染为 CSV 代码块"""
+    if len(df) <= MARKDOWN_MAX_ROWS:
+        return df_to_md(df)
+    csv = df.to_csv(index=False, float_format="%.2f", lineterminator="\n")
+    return f"```csv\n{csv}```"
+
+
+async def _report_progress(ctx, progress, total):
+    """向客户端发送进度通知；ctx 为空或通知失败时忽略"""
+    if ctx is None:
+        return
+    try:
+        await ctx.report_progress(progress, total)
+    except Exception as e:
+        logger.warning("发送进度通知失败: %s", e)
+
+
+class HistError(Exception):
+    """历史行情工具的业务错误：message 与 code 原样返回给客户端"""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def _validate_query(symbol, period, start_date, end_date, adjust):
+    """用 HistQuery 校验查询参数，不通过时抛出 HistError"""
+    try:
+        HistQuery(
+            symbol=symbol,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=adjust
+        )
+    except ValidationError as e:
+        field = e.errors()[0]['loc'][0]
+        raise HistError(*_FIELD_ERRORS.get(field, (f"参数错误: {field}", "INVALID_PARAMS"))) from None
+
+
+def _error_result(market, exc):
+    """将异常转换为 JSON 错误返回：HistError 原样输出，其他异常记录日志后归为 API_ERROR"""
+    if isinstance(exc, HistError):
+        return _err(exc.message, exc.code)
+    error_msg = f"获取{market}历史数据失败: {str(exc)}"
+    logger.error("%s", error_msg)
+    return _err(error_msg, "API_ERROR")
+
+
+async def _hist_page(fn_name, market, currency, symbol, period, start_date, end_date, adjust,
+                     extra_header, extra_footer, ctx, kwargs):
+    """
+    获取单个代码的历史行情并渲染为结果页，调用前参数须已校验
+
+    没有数据时抛出 HistError；传入 ctx 时，数据获取完成后发送一次进度通知。
+    """
+    logger.info("获取%s历史数据: symbol=%s, period=%s, start_date=%s, end_date=%s, adjust=%s",
+                market, symbol, period, start_date, end_date, adjust)
+    df = await run_blocking(
+        fetch_hist,
+        fn_name,
+        symbol=symbol,
+        period=period,
+        start_date=start_date,
+        end_date=end_date,
+        adjust=adjust,
+        **kwargs
+    )
+    await _report_progress(ctx, 1, 1)
+    if df.empty:
+        raise HistError("未找到数据，请检查股票代码或日期范围", "NO_DATA_FOUND")
+    if '日期' in df.columns:
+        # assign 生成新表，缓存中的原表保持不变
+        df = df.assign(日期=format_dates(df['日期']))
+    if len(df) > MARKDOWN_MAX_ROWS:
+        # 大表格的 CSV 序列化放到线程池，避免占用事件循环
+        md_table = await run_blocking(render_table, df)
+    else:
+        md_table = render_table(df)
+    result = _TEMPLATE.format_map({
+        "market": market,
+        "symbol": symbol,
+        "period": period,
+        "start_date": start_date,
+        "end_date": end_date,
+        "adjust_label": _ADJUST_LABEL[adjust],
+        "rows": len(df),
+        "currency": currency,
+        "extra_header": extra_header,
+        "md_table": md_table,
+        "extra_footer": extra_footer,
+    })
+    logger.info("成功获取%s数据，共 %d 条记录", market, len(df))
+    return result
+
+
+async def run_hist(fn_name, market, currency, symbol, period, start_date, end_date, adjust,
+                   extra_header="", extra_footer="", ctx=None, **kwargs):
+    """
+    历史行情工具的通用实现：参数校验、获取数据并渲染为 Markdown 文本
+
+    fn_name 为 AkShare 历史行情接口名，market/currency 用于标题与说明，
+    extra_header/extra_footer 追加到说明区与页脚，其余关键字参数透传给该接口。
+    传入 ctx 时，数据获取完成后发送一次进度通知。
+    """
+    try:
+        _validate_query(symbol, period, start_date, end_date, adjust)
+        return await _hist_page(fn_name, market, currency, symbol, period, start_date, end_date, adjust,
+                                extra_header, extra_footer, ctx, kwargs)
+    except Exception as e:
+        return _error_result(market, e)
+
+
+async def run_hist_batch(fn_name, market, currency, symbols, period, start_date, end_date, adjust,
+                         extra_header="", extra_footer="", ctx=None, **kwargs):
+    """
+    批量获取多个代码的历史行情：并发获取各代码的结果页，按代码顺序拼接
+
+    单个代码失败不影响其他代码，失败的代码以其 JSON 错误信息作为一节输出。
+    传入 ctx 时，每完成一个代码发送一次进度通知。
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return _err("symbols参数不能为空", "INVALID_SYMBOLS")
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return _err(f"symbols参数最多包含 {MAX_BATCH_SYMBOLS} 个代码", "INVALID_SYMBOLS")
+    # 周期、日期、复权对所有代码相同，扇出前校验一次
+    try:
+        _validate_query(symbols[0], period, start_date, end_date, adjust)
+    except HistError as e:
+        return _err(e.message, e.code)
+
+    done = 0
+
+    async def fetch_one(symbol):
+        nonlocal done
+        try:
+            return await _hist_page(fn_name, market, currency, symbol, period, start_date, end_date, adjust,
+                                    extra_header, extra_footer, None, kwargs)
+        finally:
+            done += 1
+            await _report_progress(ctx, done, len(symbols))
+
+    results = await asyncio.gather(*(fetch_one(symbol) for symbol in symbols), return_exceptions=True)
+    sections = []
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, BaseException):
+            error = _error_result(market, result)
+            result = f"# {market}历史行情数据\n\n**股票代码**: {symbol}\n\n{error}\n"
+        sections.append(result)
+    return "\n---\n\n".join(sections)
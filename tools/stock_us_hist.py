@@ -1,63 +1,38 @@
-import json
-import logging
 from typing import Annotated
-from datetime import datetime
-import akshare as ak
-import pandas as pd
+from fastmcp import Context
 from pydantic import Field
 
-logger = logging.getLogger(__name__)
+from tools.common import MAX_BATCH_SYMBOLS, run_hist, run_hist_batch
 
-def stock_us_hist(
+async def stock_us_hist(
     symbol: Annotated[str, Field(description="美股代码，例如 '106.TTE' 或 'AAPL'，可通过 ak.stock_us_spot_em() 获取完整代码列表")],
     period: Annotated[str, Field(description="数据周期，可选择 'daily'(日线)、'weekly'(周线)、'monthly'(月线)")] = "daily",
     start_date: Annotated[str, Field(description="开始日期，格式为 YYYYMMDD，例如 '20210101'")] = "20210101", 
     end_date: Annotated[str, Field(description="结束日期，格式为 YYYYMMDD，例如 '20240214'")] = "20240214",
-    adjust: Annotated[str, Field(description="复权类型：''(不复权)、'qfq'(前复权)、'hfq'(后复权)")] = ""
+    adjust: Annotated[str, Field(description="复权类型：''(不复权)、'qfq'(前复权)、'hfq'(后复权)")] = "",
+    ctx: Context | None = None
 ) -> str:
     """
     获取美股历史行情数据
     """
-    try:
-        logger.info(f"获取美股历史数据: symbol={symbol}, period={period}, start_date={start_date}, end_date={end_date}, adjust={adjust}")
-        if period not in ['daily', 'weekly', 'monthly']:
-            return json.dumps({
-                "error": "period参数必须是 'daily', 'weekly', 'monthly' 之一",
-                "code": "INVALID_PERIOD"
-            }, ensure_ascii=False)
-        try:
-            datetime.strptime(start_date, "%Y%m%d")
-            datetime.strptime(end_date, "%Y%m%d")
-        except ValueError:
-            return json.dumps({
-                "error": "日期格式错误，请使用 YYYYMMDD 格式",
-                "code": "INVALID_DATE_FORMAT"
-            }, ensure_ascii=False)
-        df = ak.stock_us_hist(
-            symbol=symbol,
-            period=period,
-            start_date=start_date,
-            end_date=end_date,
-            adjust=adjust
-        )
-        if df.empty:
-            return json.dumps({
-                "error": "未找到数据，请检查股票代码或日期范围",
-                "code": "NO_DATA_FOUND"
-            }, ensure_ascii=False)
-        if '日期' in df.columns:
-            df['日期'] = pd.to_datetime(df['日期']).dt.strftime('%Y-%m-%d')
-        md_table = df.to_markdown(index=False, floatfmt='.2f')
-        result = f"""# 美股历史行情数据
-\n**股票代码**: {symbol}  \n**数据周期**: {period}  \n**日期范围**: {start_date} ~ {end_date}  \n**复权方式**: {'不复权' if adjust == '' else '前复权' if adjust == 'qfq' else '后复权'}  \n**数据条数**: {len(df)} 条  \n**货币单位**: 美元 (USD)
-\n{md_table}
-\n*数据来源：东方财富网*\n"""
-        logger.info(f"成功获取数据，共 {len(df)} 条记录")
-        return result
-    except Exception as e:
-        error_msg = f"获取美股历史数据失败: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({
-            "error": error_msg,
-            "code": "API_ERROR"
-        }, ensure_ascii=False) 
\ No newline at end of file
+    return await run_hist(
+        "stock_us_hist", "美股", "美元 (USD)",
+        symbol, period, start_date, end_date, adjust, ctx=ctx
+    )
+
+
+async def stock_us_hist_batch(
+    symbols: Annotated[list[str], Field(description=f"美股代码列表，例如 ['106.TTE', 'AAPL']，最多 {MAX_BATCH_SYMBOLS} 个")],
+    period: Annotated[str, Field(description="数据周期，可选择 'daily'(日线)、'weekly'(周线)、'monthly'(月线)")] = "daily",
+    start_date: Annotated[str, Field(description="开始日期，格式为 YYYYMMDD，例如 '20210101'")] = "20210101", 
+    end_date: Annotated[str, Field(description="结束日期，格式为 YYYYMMDD，例如 '20240214'")] = "20240214",
+    adjust: Annotated[str, Field(description="复权类型：''(不复权)、'qfq'(前复权)、'hfq'(后复权)")] = "",
+    ctx: Context | None = None
+) -> str:
+    """
+    获取多只美股历史行情数据，多个代码并发获取，结果按代码依次输出
+    """
+    return await run_hist_batch(
+        "stock_us_hist", "美股", "美元 (USD)",
+        symbols, period, start_date, end_date, adjust, ctx=ctx
+    )